@@ -0,0 +1,3 @@
+# Root conftest so pytest puts the repo root on sys.path, letting
+# tests/ import custom_parsers.* under the bare `pytest` entry point
+# (not just `python -m pytest`).
@@ -0,0 +1,22 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from custom_parsers.icici_parser import _schema_for, normalize
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "data" / "icici"
+CSV_PATH = DATA_DIR / "result.csv"
+
+
+@pytest.fixture(scope="session")
+def icici_schema():
+    """(columns, numeric_cols, date_cols) derived once from result.csv."""
+    return _schema_for(CSV_PATH)
+
+
+@pytest.fixture(scope="session")
+def expected_icici_df(icici_schema):
+    """Expected frame parsed and normalized once per pytest session."""
+    _, numeric_cols, date_cols = icici_schema
+    return normalize(pd.read_csv(CSV_PATH), numeric_cols, date_cols)
@@ -0,0 +1,14 @@
+from pathlib import Path
+
+import pandas as pd
+
+from custom_parsers.icici_parser import parse
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "data" / "icici"
+PDF_PATH = DATA_DIR / "icici sample.pdf"
+
+
+def test_icici_parse(expected_icici_df, icici_schema):
+    df = parse(str(PDF_PATH), schema=icici_schema)
+    assert list(df.columns) == list(expected_icici_df.columns)
+    pd.testing.assert_frame_equal(df, expected_icici_df, check_dtype=False)